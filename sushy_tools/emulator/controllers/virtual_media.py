@@ -38,13 +38,7 @@ def virtual_media_collection_resource(identity):
 @virtual_media.route('/<device>', methods=['GET'])
 @api_utils.returns_json
 def virtual_media_resource(identity, device):
-    device_name = flask.current_app.vmedia.get_device_name(
-        identity, device)
-
-    media_types = flask.current_app.vmedia.get_device_media_types(
-        identity, device)
-
-    device_info = flask.current_app.vmedia.get_device_image_info(
+    device_info = flask.current_app.vmedia.get_device_info(
         identity, device)
 
     api_utils.debug('Serving virtual media %s at manager "%s"',
@@ -54,15 +48,15 @@ def virtual_media_resource(identity, device):
         'virtual_media.json',
         identity=identity,
         device=device,
-        name=device_name,
-        media_types=media_types,
-        image_url=device_info.image_url,
-        image_name=device_info.image_name,
-        inserted=device_info.inserted,
-        write_protected=device_info.write_protected,
-        username=device_info.username,
-        password=device_info.password,
-        verify_certificate=device_info.verify,
+        name=device_info['Name'],
+        media_types=device_info['MediaTypes'],
+        image_url=device_info['Image'],
+        image_name=device_info['ImageName'],
+        inserted=device_info['Inserted'],
+        write_protected=device_info['WriteProtected'],
+        username=device_info['UserName'],
+        password=device_info['Password'],
+        verify_certificate=device_info['Verify'],
     )
 
 
@@ -140,6 +140,20 @@ class PersistentDict(MutableMapping):
                 (key, value)
             )
 
+    @_retry
+    def update(self, *args, **kwargs):
+        """Store all the given items within a single transaction"""
+        records = [(self.encode(key), self.encode(value))
+                   for key, value in dict(*args, **kwargs).items()]
+        if not records:
+            return
+
+        with self.connection() as cursor:
+            cursor.executemany(
+                'insert or replace into cache values (?, ?)',
+                records
+            )
+
     @_retry
     def __delitem__(self, key):
         key = self.encode(key)
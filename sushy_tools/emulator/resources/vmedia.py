@@ -14,12 +14,24 @@
 #    under the License.
 
 import collections
+from concurrent import futures
+import contextlib
+import errno
 import os
 import re
+import shutil
 import tempfile
+import threading
+import time
+import types
 from urllib import parse as urlparse
 
 import requests
+from requests import adapters as requests_adapters
+from requests import exceptions as requests_exc
+from requests.packages.urllib3 import connectionpool as urllib3_pool
+from requests.packages.urllib3 import exceptions as urllib3_exc
+import tenacity
 
 from sushy_tools.emulator import memoize
 from sushy_tools.emulator.resources import base
@@ -36,6 +48,101 @@ Certificate = collections.namedtuple(
 
 _CERT_ID = "Default"
 
+_FILENAME_RE = re.compile(r'filename="([^"]+)"')
+
+# NOTE: the default size of each read when copying the image from
+# the HTTP response into the local file
+_COPY_BUFSIZE = 64 * 1024
+
+# NOTE: the default (connect, read) timeouts in seconds of the requests to
+# the image server, the read timeout applies to every read from the socket
+_TIMEOUT = (10, 60)
+
+_NETWORK_ERRORS = (requests_exc.ConnectionError, requests_exc.Timeout,
+                   urllib3_exc.ProtocolError, urllib3_exc.TimeoutError)
+
+# NOTE: transient failures are retried with exponential backoff and full
+# jitter, so that emulators hitting the same image server do not retry in
+# lockstep. Client errors reported by the server are not retried.
+_DOWNLOAD_ATTEMPTS = 5
+_DOWNLOAD_MAX_WAIT = 16
+
+_retry_download = tenacity.retry(
+    retry=tenacity.retry_if_exception_type(error.TransientFishyError),
+    wait=tenacity.wait_random_exponential(multiplier=1,
+                                          max=_DOWNLOAD_MAX_WAIT),
+    stop=tenacity.stop_after_attempt(_DOWNLOAD_ATTEMPTS),
+    reraise=True)
+
+
+def _get_image_version(headers):
+    """Return the validator identifying the image content, if any"""
+    return headers.get('etag') or headers.get('last-modified')
+
+
+class _SharedDownload(object):
+    """Download of an image awaited by concurrent insertions"""
+
+    def __init__(self):
+        self.future = futures.Future()
+        self.touched = time.monotonic()
+
+    def touch(self):
+        """Record that the download has made progress"""
+        self.touched = time.monotonic()
+
+
+class _ProgressWriter(object):
+    """File wrapper reporting every write to a callback"""
+
+    def __init__(self, fl, on_write):
+        self._fl = fl
+        self._on_write = on_write
+
+    def write(self, data):
+        written = self._fl.write(data)
+        self._on_write()
+        return written
+
+
+class _UnverifiedHTTPSConnectionPool(urllib3_pool.HTTPSConnectionPool):
+    """HTTPS pool for requests deliberately sent without TLS verification
+
+    Unverified requests are the default for virtual media, warning about
+    each of them only adds overhead to every download.
+    """
+
+    def _validate_conn(self, conn):
+        # NOTE: the same as the parent class does, minus the warning
+        urllib3_pool.HTTPConnectionPool._validate_conn(self, conn)
+
+        if getattr(conn, 'sock', None) is None:
+            conn.connect()
+
+
+class _UnverifiedHTTPAdapter(requests_adapters.HTTPAdapter):
+    """Transport adapter using `_UnverifiedHTTPSConnectionPool`"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(
+            self.poolmanager.pool_classes_by_scheme,
+            https=_UnverifiedHTTPSConnectionPool)
+
+
+def _is_running(pid):
+    """Check whether a process with the given ID exists"""
+    try:
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    except PermissionError:
+        pass
+
+    return True
+
 
 class StaticDriver(base.DriverBase):
     """Redfish virtual media simulator."""
@@ -67,15 +174,53 @@ class StaticDriver(base.DriverBase):
                 }
             }
 
-        self._device_types = device_types
+        self._device_types = types.MappingProxyType(dict(device_types))
+        self._device_ids = tuple(self._device_types)
+
+        # NOTE: resources whose devices are known to exist
+        self._seeded = set()
+
+        # NOTE: keep connections to the image servers alive between
+        # downloads instead of doing the TCP and TLS handshakes every time.
+        # Older requests releases reuse pooled connections regardless of
+        # the TLS verification they were opened with, so each verification
+        # setting gets its own session.
+        self._http = {}
+        self._http_lock = threading.Lock()
+
+        # NOTE: images downloaded by this process, keyed by URL and ordered
+        # from the least to the most recently used
+        self._image_cache = collections.OrderedDict()
+        self._image_cache_lock = threading.Lock()
+        # NOTE: the cached hard links must live on the same file system as
+        # the downloads, and each process keeps its own cache
+        self._image_cache_dir = os.path.join(
+            tempfile.gettempdir(), 'sushy-emulator-vmedia-cache',
+            str(os.getpid()))
+        self._clear_image_cache_dir()
+
+        # NOTE: downloads in progress, so that concurrent insertions of
+        # the same image wait for a single download
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _ensure_identity(self, identity):
+        """Create missing virtual media devices for the resource
 
-    def _get_device(self, identity, device):
-        try:
-            return self._devices[(identity, device)]
+        :param identity: parent resource ID
+        """
+        if identity in self._seeded:
+            return
 
-        except KeyError:
-            self._devices.update(
-                {(identity, k): v for k, v in self._device_types.items()})
+        missing = {(identity, k): v for k, v in self._device_types.items()
+                   if (identity, k) not in self._devices}
+        if missing:
+            self._devices.update(missing)
+
+        self._seeded.add(identity)
+
+    def _get_device(self, identity, device):
+        self._ensure_identity(identity)
 
         try:
             return self._devices[(identity, device)]
@@ -85,6 +230,36 @@ class StaticDriver(base.DriverBase):
                 'No such virtual media device %s owned by resource '
                 '%s' % (device, identity))
 
+    def _get_http(self, verify):
+        """Return the HTTP session for the given TLS verification setting
+
+        :param verify: TLS verification as accepted by `requests`
+        :returns: a `requests.Session` only used with this setting
+        """
+        with self._http_lock:
+            try:
+                return self._http[verify]
+
+            except KeyError:
+                http = self._http[verify] = requests.Session()
+                adapter_class = (requests_adapters.HTTPAdapter if verify
+                                 else _UnverifiedHTTPAdapter)
+                adapter = adapter_class(pool_connections=4, pool_maxsize=16)
+                http.mount('http://', adapter)
+                http.mount('https://', adapter)
+                return http
+
+    def _drop_http(self, verify):
+        """Close the HTTP session for the given TLS verification setting
+
+        :param verify: TLS verification as accepted by `requests`
+        """
+        with self._http_lock:
+            http = self._http.pop(verify, None)
+
+        if http is not None:
+            http.close()
+
     @property
     def driver(self):
         """Return human-friendly driver information
@@ -97,9 +272,9 @@ class StaticDriver(base.DriverBase):
     def devices(self):
         """Return available Redfish virtual media devices
 
-        :returns: list of virtual media devices IDs
+        :returns: tuple of virtual media devices IDs
         """
-        return list(self._device_types)
+        return self._device_ids
 
     def get_device_name(self, identity, device):
         """Get virtual media device name
@@ -123,6 +298,30 @@ class StaticDriver(base.DriverBase):
         device_info = self._get_device(identity, device)
         return device_info.get('MediaTypes', [])
 
+    def get_device_info(self, identity, device):
+        """Get all properties of the virtual media device at once
+
+        :param identity: parent resource ID
+        :param device: device name
+        :returns: a `dict` with `Name`, `MediaTypes`, `ImageName`, `Image`,
+            `Inserted`, `WriteProtected`, `UserName`, `Password` and
+            `Verify` keys
+        :raises: `error.FishyError`
+        """
+        device_info = self._get_device(identity, device)
+
+        return {
+            'Name': device_info.get('Name', identity),
+            'MediaTypes': list(device_info.get('MediaTypes', [])),
+            'ImageName': device_info.get('ImageName', ''),
+            'Image': device_info.get('Image', ''),
+            'Inserted': device_info.get('Inserted', False),
+            'WriteProtected': device_info.get('WriteProtected', False),
+            'UserName': device_info.get('UserName', ''),
+            'Password': device_info.get('Password', ''),
+            'Verify': device_info.get('Verify', False),
+        }
+
     def get_device_image_info(self, identity, device):
         """Get media state of the virtual media device
 
@@ -133,15 +332,15 @@ class StaticDriver(base.DriverBase):
             user name and password
         :raises: `error.FishyError`
         """
-        device_info = self._get_device(identity, device)
+        device_info = self.get_device_info(identity, device)
 
-        return DeviceInfo(device_info.get('ImageName', ''),
-                          device_info.get('Image', ''),
-                          device_info.get('Inserted', False),
-                          device_info.get('WriteProtected', False),
-                          device_info.get('UserName', ''),
-                          device_info.get('Password', ''),
-                          device_info.get('Verify', False))
+        return DeviceInfo(device_info['ImageName'],
+                          device_info['Image'],
+                          device_info['Inserted'],
+                          device_info['WriteProtected'],
+                          device_info['UserName'],
+                          device_info['Password'],
+                          device_info['Verify'])
 
     def update_device_info(self, identity, device, verify=False):
         """Update the virtual media device
@@ -196,20 +395,15 @@ class StaticDriver(base.DriverBase):
         del device_info["Certificate"]
         self._devices[(identity, device)] = device_info
 
-    def _write_from_response(self, image_url, rsp, tmp_file):
-        with open(tmp_file.name, 'wb') as fl:
-            for chunk in rsp.iter_content(chunk_size=8192):
-                if chunk:
-                    fl.write(chunk)
-
+    @staticmethod
+    def _get_local_file_name(image_url, rsp):
         local_file = None
 
         content_dsp = rsp.headers.get('content-disposition')
         if content_dsp:
-            local_file = re.findall('filename="(.+)"', content_dsp)
-
-        if local_file:
-            local_file = local_file[0]
+            match = _FILENAME_RE.search(content_dsp)
+            if match:
+                local_file = match.group(1)
 
         if not local_file:
             parsed_url = urlparse.urlparse(image_url)
@@ -220,6 +414,480 @@ class StaticDriver(base.DriverBase):
 
         return local_file
 
+    def _preallocate(self, fl, rsp):
+        """Reserve disk space for the image if its size is known upfront
+
+        :param fl: file object to write the image to
+        :param rsp: HTTP response the image is read from
+        """
+        # NOTE: Content-Length refers to the encoded body, which is not
+        # what ends up on the disk
+        if (not hasattr(os, 'posix_fallocate')
+                or rsp.headers.get('content-encoding')):
+            return
+
+        try:
+            size = int(rsp.headers.get('content-length', 0))
+        except ValueError:
+            return
+
+        if size <= 0:
+            return
+
+        try:
+            os.posix_fallocate(fl.fileno(), 0, size)
+
+        except OSError as ex:
+            if ex.errno not in (errno.EOPNOTSUPP, errno.ENOSYS,
+                                errno.EINVAL):
+                raise
+
+            self._logger.debug(
+                'Cannot preallocate %d bytes for %s: %s', size, fl.name, ex)
+
+    def _clear_image_cache_dir(self):
+        """Remove images cached by processes that are no longer running
+
+        The cache index is only kept in memory, so images cached by
+        a previous incarnation of this process are removed as well.
+        """
+        cache_root = os.path.dirname(self._image_cache_dir)
+        try:
+            entries = os.listdir(cache_root)
+
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            try:
+                pid = int(entry)
+            except ValueError:
+                continue
+
+            if pid != os.getpid() and _is_running(pid):
+                continue
+
+            self._logger.debug(
+                'Removing virtual media images cached by process %d', pid)
+            shutil.rmtree(os.path.join(cache_root, entry),
+                          ignore_errors=True)
+
+    @staticmethod
+    def _link_local_image(source_path, parent_dir=None):
+        """Hard link an image into a newly created temporary directory
+
+        :param source_path: path to the local image to link
+        :param parent_dir: where to create the temporary directory,
+            the default temporary directory if not given
+        :returns: path to the new link
+        :raises: `OSError` if the link can't be created
+        """
+        temp_dir = tempfile.mkdtemp(dir=parent_dir)
+        local_file_path = os.path.join(temp_dir,
+                                       os.path.basename(source_path))
+        try:
+            os.link(source_path, local_file_path)
+
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        return local_file_path
+
+    def _get_timeout(self):
+        """Return the (connect, read) timeouts of image server requests
+
+        :returns: a tuple of timeouts in seconds or `None` if disabled
+        """
+        timeout = self._config.get('SUSHY_EMULATOR_VMEDIA_TIMEOUT', _TIMEOUT)
+        if timeout is None:
+            return
+
+        if isinstance(timeout, (int, float)):
+            return timeout, timeout
+
+        connect, read = timeout
+        return connect, read
+
+    def _get_shared_wait_timeout(self):
+        """Return how long a concurrent download may make no progress
+
+        This matches the time a download stalled on every attempt takes
+        to fail.
+
+        :returns: timeout in seconds or `None` if timeouts are disabled
+        """
+        timeout = self._get_timeout()
+        if timeout is None:
+            return
+
+        return _DOWNLOAD_ATTEMPTS * (sum(timeout) + _DOWNLOAD_MAX_WAIT)
+
+    def _image_unchanged(self, image_url, auth, verify, version):
+        """Check whether the image at the URL still has the given version
+
+        :param image_url: URL to ISO image
+        :param auth: a tuple of user name and password or `None`
+        :param verify: TLS verification as accepted by `requests`
+        :param version: ETag or Last-Modified of the known image or `None`
+        :returns: `True` if the server reports the same version
+        """
+        if not version:
+            return False
+
+        try:
+            # NOTE: servers may weaken or change the validator of encoded
+            # responses, so ask for the same encoding as the download
+            with self._get_http(verify).head(
+                    image_url, auth=auth, verify=verify,
+                    headers={'Accept-Encoding': 'identity'},
+                    timeout=self._get_timeout(),
+                    allow_redirects=True) as rsp:
+                return (rsp.status_code < 400
+                        and _get_image_version(rsp.headers) == version)
+
+        except requests_exc.RequestException as ex:
+            self._logger.debug(
+                'Cannot check the version of image from URL %s: %s',
+                image_url, ex)
+            return False
+
+    def _get_cached_image(self, image_url, auth, verify):
+        """Reuse a previously downloaded image if it has not changed
+
+        :param image_url: URL to ISO image
+        :param auth: a tuple of user name and password or `None`
+        :param verify: TLS verification as accepted by `requests`
+        :returns: a tuple of the path to a new local copy of the image and
+            its version or `None`
+        """
+        with self._image_cache_lock:
+            try:
+                cached_path, version, _size = self._image_cache[image_url]
+            except KeyError:
+                return
+
+        if not self._image_unchanged(image_url, auth, verify, version):
+            return
+
+        try:
+            local_file_path = self._link_local_image(cached_path)
+
+        except OSError as ex:
+            self._logger.debug(
+                'Not using cached image from URL %s: %s', image_url, ex)
+            return
+
+        with self._image_cache_lock:
+            if image_url in self._image_cache:
+                self._image_cache.move_to_end(image_url)
+
+        self._logger.debug(
+            'Using cached image %s for URL %s', cached_path, image_url)
+
+        return local_file_path, version
+
+    def _cache_image(self, image_url, version, local_file_path):
+        """Remember a downloaded image for later reuse
+
+        The cache keeps its own hard link to the image, so that it survives
+        media ejection. Least recently used images are dropped once
+        the total size of the images cached by this process exceeds
+        `SUSHY_EMULATOR_VMEDIA_CACHE_SIZE` bytes.
+
+        :param image_url: URL the image was downloaded from
+        :param version: ETag or Last-Modified of the image
+        :param local_file_path: path to the downloaded image
+        """
+        cache_size = self._config.get('SUSHY_EMULATOR_VMEDIA_CACHE_SIZE', 0)
+        if not cache_size or not version:
+            return
+
+        with self._image_cache_lock:
+            entry = self._image_cache.get(image_url)
+            if entry and entry[1] == version:
+                self._image_cache.move_to_end(image_url)
+                return
+
+        try:
+            size = os.path.getsize(local_file_path)
+            if size > cache_size:
+                return
+
+            os.makedirs(self._image_cache_dir, exist_ok=True)
+            cached_path = self._link_local_image(local_file_path,
+                                                 self._image_cache_dir)
+
+        except OSError as ex:
+            self._logger.debug(
+                'Not caching image from URL %s: %s', image_url, ex)
+            return
+
+        evicted = []
+
+        with self._image_cache_lock:
+            stale = self._image_cache.pop(image_url, None)
+            if stale:
+                evicted.append(stale)
+
+            self._image_cache[image_url] = cached_path, version, size
+
+            total = sum(entry[2] for entry in self._image_cache.values())
+            while total > cache_size:
+                _url, entry = self._image_cache.popitem(last=False)
+                total -= entry[2]
+                evicted.append(entry)
+
+        for path, _version, _size in evicted:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    @staticmethod
+    def _is_resumable(rsp, version):
+        # NOTE: offsets into the local file only match offsets into
+        # the body if it is not encoded, and If-Range needs a strong
+        # validator
+        return bool(rsp.headers.get('accept-ranges') == 'bytes'
+                    and not rsp.headers.get('content-encoding')
+                    and version and not version.startswith('W/'))
+
+    @staticmethod
+    def _discard_progress(progress):
+        path = progress.get('path')
+        if path:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+        progress.clear()
+
+    @_retry_download
+    def _fetch_and_create_local_image(self, image_url, auth, verify,
+                                      progress, on_write=None):
+        """Download the image into a newly created temporary directory
+
+        If the previous attempt was interrupted and the server supports
+        range requests, the download continues from where it stopped.
+
+        :param image_url: URL to ISO image to download
+        :param auth: a tuple of user name and password or `None`
+        :param verify: TLS verification as accepted by `requests`
+        :param progress: a `dict` carrying the partially downloaded image
+            between attempts, it is emptied once the download completes
+        :param on_write: a callable invoked after every write to the local
+            file or `None`
+        :returns: a tuple of the path to the local copy of the image and
+            the ETag or Last-Modified of the image or `None`
+        :raises: `TransientFishyError` on network failures and server
+            errors, `FishyError` on other HTTP errors
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        offset = progress.get('offset')
+        if offset:
+            headers['Range'] = 'bytes=%d-' % offset
+            headers['If-Range'] = progress['version']
+
+        try:
+            with self._get_http(verify).get(
+                    image_url, stream=True, auth=auth, verify=verify,
+                    headers=headers, timeout=self._get_timeout()) as rsp:
+                if offset and rsp.status_code == 416:
+                    self._discard_progress(progress)
+                    raise error.TransientFishyError(
+                        "Cannot resume virtual media download: the server "
+                        "rejected the range", code=502)
+
+                if rsp.status_code >= 400:
+                    self._logger.error(
+                        'Failed fetching image from URL %s: '
+                        'got HTTP error %s:\n%s',
+                        image_url, rsp.status_code, rsp.text)
+                    if rsp.status_code >= 500:
+                        raise error.TransientFishyError(
+                            "Cannot download virtual media: got error %s "
+                            "from the server" % rsp.status_code, code=502)
+
+                    raise error.FishyError(
+                        "Cannot download virtual media: got error %s "
+                        "from the server" % rsp.status_code, code=400)
+
+                content_range = rsp.headers.get('content-range', '')
+                if (offset and rsp.status_code == 206
+                        and content_range.startswith('bytes %d-' % offset)):
+                    self._logger.debug(
+                        'Resuming download of image from URL %s at byte %d',
+                        image_url, offset)
+                    local_file_path = progress['path']
+                    version = progress['version']
+                    resumable = True
+                    mode = 'r+b'
+
+                else:
+                    self._discard_progress(progress)
+                    offset = 0
+                    local_file = self._get_local_file_name(image_url, rsp)
+                    version = _get_image_version(rsp.headers)
+                    resumable = self._is_resumable(rsp, version)
+                    temp_dir = tempfile.mkdtemp()
+                    local_file_path = os.path.join(temp_dir, local_file)
+                    mode = 'wb'
+
+                bufsize = self._config.get(
+                    'SUSHY_EMULATOR_VMEDIA_COPY_BUFSIZE', _COPY_BUFSIZE)
+                # NOTE: let urllib3 undo any Content-Encoding while reading
+                # from the raw stream, the way iter_content() would do
+                rsp.raw.decode_content = True
+
+                try:
+                    with open(local_file_path, mode) as fl:
+                        if offset:
+                            fl.seek(offset)
+                        else:
+                            self._preallocate(fl, rsp)
+
+                        try:
+                            shutil.copyfileobj(
+                                rsp.raw,
+                                _ProgressWriter(fl, on_write) if on_write
+                                else fl,
+                                bufsize)
+
+                        except _NETWORK_ERRORS:
+                            if resumable:
+                                progress.update(path=local_file_path,
+                                                offset=fl.tell(),
+                                                version=version)
+                            raise
+
+                        # NOTE: drop preallocated space not used by the image
+                        fl.truncate()
+
+                except _NETWORK_ERRORS:
+                    if not progress:
+                        shutil.rmtree(os.path.dirname(local_file_path),
+                                      ignore_errors=True)
+                    raise
+
+                except Exception:
+                    progress.clear()
+                    shutil.rmtree(os.path.dirname(local_file_path),
+                                  ignore_errors=True)
+                    raise
+
+        except _NETWORK_ERRORS as ex:
+            raise error.TransientFishyError(
+                "Cannot download virtual media: %s" % ex, code=502)
+
+        progress.clear()
+
+        return local_file_path, version
+
+    def _wait_shared(self, shared):
+        """Wait for a concurrent download as long as it makes progress
+
+        :param shared: a `_SharedDownload` to wait for
+        :returns: whatever the download returned or `None` if it has not
+            made progress for too long
+        """
+        stall_timeout = self._get_shared_wait_timeout()
+
+        while True:
+            timeout = None
+            if stall_timeout is not None:
+                timeout = shared.touched + stall_timeout - time.monotonic()
+                if timeout <= 0:
+                    return
+
+            try:
+                return shared.future.result(timeout=timeout)
+
+            except futures.TimeoutError:
+                continue
+
+    def _fetch_shared(self, fetch_key, image_url, auth, verify, progress):
+        """Download the image unless the same download is in progress
+
+        Concurrent callers with the same `fetch_key` wait for the first
+        one to finish and receive hard links to its image. If it stops
+        making progress, one of them takes the download over.
+
+        :param fetch_key: hashable identifying the URL and its credentials
+        :param image_url: URL to ISO image to download
+        :param auth: a tuple of user name and password or `None`
+        :param verify: TLS verification as accepted by `requests`
+        :param progress: a `dict` carrying the partially downloaded image
+        :returns: a tuple of the path to the local copy of the image and
+            the ETag or Last-Modified of the image or `None`
+        """
+        while True:
+            with self._inflight_lock:
+                shared = self._inflight.get(fetch_key)
+                leader = shared is None
+                if leader:
+                    shared = self._inflight[fetch_key] = _SharedDownload()
+
+            if leader:
+                break
+
+            result = self._wait_shared(shared)
+            if result is not None:
+                source_path, version = result
+                try:
+                    return self._link_local_image(source_path), version
+
+                except OSError as ex:
+                    self._logger.debug(
+                        'Cannot share image %s downloaded concurrently from '
+                        'URL %s, downloading again: %s', source_path,
+                        image_url, ex)
+                    return self._fetch_and_create_local_image(
+                        image_url, auth, verify, progress)
+
+            self._logger.debug(
+                'Concurrent download from URL %s has stalled, taking it '
+                'over', image_url)
+            with self._inflight_lock:
+                if self._inflight.get(fetch_key) is shared:
+                    del self._inflight[fetch_key]
+
+        try:
+            result = self._fetch_and_create_local_image(
+                image_url, auth, verify, progress, on_write=shared.touch)
+
+        except Exception as ex:
+            shared.future.set_exception(ex)
+            raise
+
+        else:
+            shared.future.set_result(result)
+            return result
+
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(fetch_key) is shared:
+                    del self._inflight[fetch_key]
+
+    def _remove_local_file(self, identity, local_file):
+        """Remove a downloaded image along with its temporary directory
+
+        :param identity: parent resource ID
+        :param local_file: path to the local copy of the image
+        """
+        try:
+            os.unlink(local_file)
+
+        except FileNotFoundError:
+            pass
+
+        try:
+            os.rmdir(os.path.dirname(local_file))
+
+        except OSError as ex:
+            self._logger.debug(
+                'Cannot remove the directory of local file %s: %s',
+                local_file, ex)
+
+        self._logger.debug(
+            'Removed local file %(file)s for %(identity)s' % {
+                'identity': identity, 'file': local_file})
+
     def insert_image(self, identity, device, image_url,
                      inserted=True, write_protected=True,
                      username=None, password=None):
@@ -255,63 +923,94 @@ class StaticDriver(base.DriverBase):
 
         auth = (username, password) if (username and password) else None
 
-        if custom_cert is not None:
-            custom_cert_file = tempfile.NamedTemporaryFile(mode='wt')
-            custom_cert_file.write(custom_cert)
-            custom_cert_file.flush()
-            verify_media_cert = custom_cert_file.name
+        progress = {}
 
-        try:
-            with requests.get(image_url,
-                              stream=True,
-                              auth=auth,
-                              verify=verify_media_cert) as rsp:
-                if rsp.status_code >= 400:
-                    self._logger.error(
-                        'Failed fetching image from URL %s: '
-                        'got HTTP error %s:\n%s',
-                        image_url, rsp.status_code, rsp.text)
-                    target_code = 502 if rsp.status_code >= 500 else 400
-                    raise error.FishyError(
-                        "Cannot download virtual media: got error %s "
-                        "from the server" % rsp.status_code,
-                        code=target_code)
-
-                with tempfile.NamedTemporaryFile(
-                        mode='w+b', delete=False) as tmp_file:
-
-                    local_file = self._write_from_response(image_url,
-                                                           rsp, tmp_file)
-                    temp_dir = tempfile.mkdtemp(
-                        dir=os.path.dirname(tmp_file.name))
-                    local_file_path = os.path.join(temp_dir, local_file)
-
-                os.rename(tmp_file.name, local_file_path)
-        except error.FishyError as ex:
-            msg = 'Failed fetching image from URL %s: %s' % (image_url, ex)
-            self._logger.error(msg)
-            raise  # leave the original error intact (code, etc)
-        except Exception as ex:
-            msg = 'Failed fetching image from URL %s: %s' % (image_url, ex)
-            self._logger.exception(msg)
-            raise error.FishyError(msg)
-        finally:
+        with contextlib.ExitStack() as stack:
             if custom_cert is not None:
-                custom_cert_file.close()
+                custom_cert_file = stack.enter_context(
+                    tempfile.NamedTemporaryFile(mode='wt'))
+                custom_cert_file.write(custom_cert)
+                custom_cert_file.flush()
+                verify_media_cert = custom_cert_file.name
+                # NOTE: the certificate file is unique to this insertion,
+                # so its connections are not worth keeping around
+                stack.callback(self._drop_http, verify_media_cert)
+
+            try:
+                local_file_path = device_info.get('_local_file')
+                if (local_file_path
+                        and device_info.get('_image_url') == image_url
+                        and device_info.get('Inserted') == inserted
+                        and (device_info.get('WriteProtected')
+                             == write_protected)
+                        and device_info.get('UserName') == (username or '')
+                        and device_info.get('Password') == (password or '')
+                        and os.path.exists(local_file_path)
+                        and self._image_unchanged(
+                            image_url, auth, verify_media_cert,
+                            device_info.get('_image_version'))):
+                    self._logger.debug(
+                        'Image from URL %(url)s is already inserted into '
+                        '%(identity)s' % {'identity': identity,
+                                          'url': image_url})
+                    return local_file_path
+
+                # NOTE: cached images are shared through hard links, so they
+                # are only handed out when the guest can not write to them
+                cached = None
+                if write_protected:
+                    cached = self._get_cached_image(
+                        image_url, auth, verify_media_cert)
+
+                if cached:
+                    local_file_path, version = cached
+
+                elif write_protected:
+                    fetch_key = (image_url, auth, custom_cert,
+                                 bool(verify_media_cert))
+                    local_file_path, version = self._fetch_shared(
+                        fetch_key, image_url, auth, verify_media_cert,
+                        progress)
+
+                    self._cache_image(image_url, version, local_file_path)
+
+                else:
+                    local_file_path, version = (
+                        self._fetch_and_create_local_image(
+                            image_url, auth, verify_media_cert, progress))
+            except error.FishyError as ex:
+                msg = 'Failed fetching image from URL %s: %s' % (image_url, ex)
+                self._logger.error(msg)
+                raise  # leave the original error intact (code, etc)
+            except Exception as ex:
+                msg = 'Failed fetching image from URL %s: %s' % (image_url, ex)
+                self._logger.exception(msg)
+                raise error.FishyError(msg)
+            finally:
+                self._discard_progress(progress)
+
+        local_file = os.path.basename(local_file_path)
 
         self._logger.debug(
             'Fetched image %(file)s for %(identity)s' % {
                 'identity': identity, 'file': local_file})
 
+        previous_file = device_info.get('_local_file')
+
         device_info['Image'] = local_file
         device_info['Inserted'] = inserted
         device_info['WriteProtected'] = write_protected
         device_info['UserName'] = username or ''
         device_info['Password'] = password or ''
         device_info['_local_file'] = local_file_path
+        device_info['_image_url'] = image_url
+        device_info['_image_version'] = version
 
         self._devices.update({(identity, device): device_info})
 
+        if previous_file and previous_file != local_file_path:
+            self._remove_local_file(identity, previous_file)
+
         return local_file_path
 
     def eject_image(self, identity, device):
@@ -330,12 +1029,11 @@ class StaticDriver(base.DriverBase):
         device_info['UserName'] = ''
         device_info['Password'] = ''
 
+        local_file = device_info.pop('_local_file', None)
+        device_info.pop('_image_url', None)
+        device_info.pop('_image_version', None)
+
         self._devices.update({(identity, device): device_info})
 
-        local_file = device_info.pop('_local_file', None)
         if local_file:
-            os.unlink(local_file)
-
-            self._logger.debug(
-                'Removed local file %(file)s for %(identity)s' % {
-                    'identity': identity, 'file': local_file})
+            self._remove_local_file(identity, local_file)
@@ -22,6 +22,10 @@ class FishyError(Exception):
         self.code = code
 
 
+class TransientFishyError(FishyError):
+    """Failure that may go away if the operation is retried"""
+
+
 class AliasAccessError(FishyError):
     """Node access attempted via an alias, not UUID"""
 
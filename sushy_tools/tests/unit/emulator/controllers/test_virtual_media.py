@@ -49,11 +49,11 @@ class VirtualMediaTestCase(test_main.EmulatorTestCase):
 
     def test_virtual_media(self, managers_mock, vmedia_mock):
         vmedia_mock = vmedia_mock.return_value
-        vmedia_mock.get_device_name.return_value = 'CD'
-        vmedia_mock.get_device_media_types.return_value = [
-            'CD', 'DVD']
-        vmedia_mock.get_device_image_info.return_value = vmedia.DeviceInfo(
-            'image-of-a-fish', 'fishy.iso', True, True, '', '', False)
+        vmedia_mock.get_device_info.return_value = {
+            'Name': 'CD', 'MediaTypes': ['CD', 'DVD'],
+            'ImageName': 'image-of-a-fish', 'Image': 'fishy.iso',
+            'Inserted': True, 'WriteProtected': True,
+            'UserName': '', 'Password': '', 'Verify': False}
 
         response = self.app.get(
             '/redfish/v1/Managers/%s/VirtualMedia/CD' % self.uuid)
@@ -74,12 +74,11 @@ class VirtualMediaTestCase(test_main.EmulatorTestCase):
 
     def test_virtual_media_with_auth(self, managers_mock, vmedia_mock):
         vmedia_mock = vmedia_mock.return_value
-        vmedia_mock.get_device_name.return_value = 'CD'
-        vmedia_mock.get_device_media_types.return_value = [
-            'CD', 'DVD']
-        vmedia_mock.get_device_image_info.return_value = vmedia.DeviceInfo(
-            'image-of-a-fish', 'fishy.iso', True, True, 'Admin', 'Secret',
-            False)
+        vmedia_mock.get_device_info.return_value = {
+            'Name': 'CD', 'MediaTypes': ['CD', 'DVD'],
+            'ImageName': 'image-of-a-fish', 'Image': 'fishy.iso',
+            'Inserted': True, 'WriteProtected': True,
+            'UserName': 'Admin', 'Password': 'Secret', 'Verify': False}
 
         response = self.app.get(
             '/redfish/v1/Managers/%s/VirtualMedia/CD' % self.uuid)
@@ -96,7 +95,7 @@ class VirtualMediaTestCase(test_main.EmulatorTestCase):
         self.assertFalse(response.json['VerifyCertificate'])
 
     def test_virtual_media_not_found(self, managers_mock, vmedia_mock):
-        vmedia_mock.return_value.get_device_name.side_effect = error.NotFound
+        vmedia_mock.return_value.get_device_info.side_effect = error.NotFound
 
         response = self.app.get(
             '/redfish/v1/Managers/%s/VirtualMedia/DVD-ROM' % self.uuid)
@@ -14,9 +14,16 @@
 #    under the License.
 
 import builtins
+from concurrent import futures
+import errno
+import os
+import shutil
+import tempfile
 from unittest import mock
+import warnings
 
 from oslotest import base
+from requests import adapters as requests_adapters
 
 from sushy_tools.emulator.resources import vmedia
 from sushy_tools import error
@@ -26,6 +33,10 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     UUID = 'ZZZ-YYY-XXX'
 
+    HEADERS = {'Accept-Encoding': 'identity'}
+
+    TIMEOUT = (10, 60)
+
     CONFIG = {
         'SUSHY_EMULATOR_VMEDIA_DEVICES': {
             "Cd": {
@@ -47,15 +58,49 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     def setUp(self):
         super().setUp()
+        session_patcher = mock.patch.object(vmedia.requests, 'Session',
+                                            autospec=True)
+        self.mock_session = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        self.mock_http = self.mock_session.return_value
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
         with mock.patch('sushy_tools.emulator.memoize.PersistentDict',
-                        return_value={}, autospec=True):
-            self.test_driver = vmedia.StaticDriver(self.CONFIG,
+                        return_value={}, autospec=True), \
+                mock.patch.object(vmedia.tempfile, 'gettempdir',
+                                  return_value=self.temp_dir):
+            self.test_driver = vmedia.StaticDriver(dict(self.CONFIG),
                                                    mock.MagicMock())
 
     def test_devices(self):
         devices = self.test_driver.devices
         self.assertEqual(['Cd', 'Floppy'], sorted(devices))
 
+    def test_get_device_seeds_missing(self):
+        self.test_driver._devices[(self.UUID, 'Cd')] = {'Name': 'Old CD'}
+
+        device_info = self.test_driver._get_device(self.UUID, 'Floppy')
+
+        self.assertEqual('Virtual Removable Media', device_info['Name'])
+        self.assertEqual(
+            'Old CD', self.test_driver._devices[(self.UUID, 'Cd')]['Name'])
+        self.assertIn(self.UUID, self.test_driver._seeded)
+
+    def test_get_device_seeds_once(self):
+        self.test_driver._get_device(self.UUID, 'Cd')
+
+        with mock.patch.object(self.test_driver, '_devices',
+                               autospec=True) as mock_devices:
+            self.test_driver._get_device(self.UUID, 'Floppy')
+
+            mock_devices.update.assert_not_called()
+            mock_devices.__getitem__.assert_called_once_with(
+                (self.UUID, 'Floppy'))
+
+    def test_get_device_not_found(self):
+        self.assertRaises(error.NotFound, self.test_driver._get_device,
+                          self.UUID, 'Tape')
+
     def test_get_device_name(self):
         device_name = self.test_driver.get_device_name(
             self.UUID, 'Cd')
@@ -72,6 +117,24 @@ class StaticDriverTestCase(base.BaseTestCase):
         expected = ('', '', False, False, '', '', False)
         self.assertEqual(expected, dev_info)
 
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_get_device_info(self, mock_get_device):
+        mock_get_device.return_value = {
+            'Name': 'Virtual CD', 'MediaTypes': ['CD', 'DVD'],
+            'Image': 'fish.iso', 'Inserted': True, 'UserName': 'Admin',
+            'Password': 'Secret', '_local_file': '/alphabet/soup/fish.iso',
+            'Certificate': {'Type': 'PEM', 'String': 'abcd'}}
+
+        device_info = self.test_driver.get_device_info(self.UUID, 'Cd')
+
+        self.assertEqual({'Name': 'Virtual CD', 'MediaTypes': ['CD', 'DVD'],
+                          'ImageName': '', 'Image': 'fish.iso',
+                          'Inserted': True, 'WriteProtected': False,
+                          'UserName': 'Admin', 'Password': 'Secret',
+                          'Verify': False}, device_info)
+        mock_get_device.assert_called_once_with(
+            self.test_driver, self.UUID, 'Cd')
+
     def test_update_device_info(self):
         dev_info = self.test_driver.get_device_image_info(self.UUID, 'Cd')
         self.assertFalse(dev_info.verify)
@@ -82,35 +145,33 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image(self, mock_requests, mock_tempfile, mock_rename,
+    def test_insert_image(self, mock_tempfile,
                           mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.side_effect = [b'fish', b'']
 
         local_file = self.test_driver.insert_image(
             self.UUID, 'Cd', 'http://fish.it/red.iso', inserted=True,
             write_protected=False)
 
         self.assertEqual('/alphabet/soup/fish.iso', local_file)
-        mock_requests.get.assert_called_once_with(
-            'http://fish.it/red.iso', stream=True, verify=False, auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/fish.iso')
+        self.mock_http.get.assert_called_once_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/fish.iso', 'wb')
+        mock_rsp.raw.read.assert_called_with(vmedia._COPY_BUFSIZE)
+        mock_fl = mock_open.return_value.__enter__.return_value
+        mock_fl.write.assert_called_once_with(b'fish')
 
         self.assertEqual('fish.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -118,39 +179,101 @@ class StaticDriverTestCase(base.BaseTestCase):
         self.assertEqual('', device_info['UserName'])
         self.assertEqual('', device_info['Password'])
         self.assertEqual(local_file, device_info['_local_file'])
+        self.assertEqual('http://fish.it/red.iso', device_info['_image_url'])
+        self.assertIsNone(device_info['_image_version'])
+
+    def test__get_local_file_name(self):
+        mock_rsp = mock.Mock(headers={
+            'content-disposition':
+                'attachment; filename="fish.iso"; filename*="x.iso"'})
+        self.assertEqual('fish.iso', self.test_driver._get_local_file_name(
+            'http://fish.it/red.iso', mock_rsp))
+
+    def test__get_local_file_name_fallback(self):
+        mock_rsp = mock.Mock(headers={'content-disposition': 'inline'})
+        self.assertEqual('red.iso', self.test_driver._get_local_file_name(
+            'http://fish.it/red.iso', mock_rsp))
+        self.assertEqual('image.iso', self.test_driver._get_local_file_name(
+            'http://fish.it/', mock_rsp))
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(vmedia.os, 'posix_fallocate', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_preallocate(self, mock_tempfile,
+                                      mock_open, mock_fallocate,
+                                      mock_get_device):
+        mock_get_device.return_value = {}
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
+        mock_rsp.headers = {
+            'content-disposition': 'attachment; filename="fish.iso"',
+            'content-length': '4096'
+        }
+        mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
+        mock_fallocate.side_effect = OSError(errno.EOPNOTSUPP, 'tmpfs')
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        mock_fl = mock_open.return_value.__enter__.return_value
+        mock_fallocate.assert_called_once_with(mock_fl.fileno.return_value,
+                                               0, 4096)
+        mock_fl.truncate.assert_called_once_with()
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(vmedia.os, 'posix_fallocate', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_preallocate_encoded(self, mock_tempfile, mock_open,
+                                              mock_fallocate,
+                                              mock_get_device):
+        mock_get_device.return_value = {}
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
+        mock_rsp.headers = {
+            'content-encoding': 'gzip',
+            'content-length': '4096'
+        }
+        mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
+
+        self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        mock_fallocate.assert_not_called()
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_auth(self, mock_requests, mock_tempfile, mock_rename,
+    def test_insert_image_auth(self, mock_tempfile,
                                mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
 
         local_file = self.test_driver.insert_image(
             self.UUID, 'Cd', 'http://fish.it/red.iso', inserted=True,
             write_protected=False, username='Admin', password='Secret')
 
         self.assertEqual('/alphabet/soup/fish.iso', local_file)
-        mock_requests.get.assert_called_once_with(
+        self.mock_http.get.assert_called_once_with(
             'http://fish.it/red.iso', stream=True, verify=False,
-            auth=('Admin', 'Secret'))
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/fish.iso')
+            auth=('Admin', 'Secret'), headers=self.HEADERS,
+            timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/fish.iso', 'wb')
 
         self.assertEqual('fish.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -161,34 +284,28 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_no_local_file(self, mock_requests, mock_tempfile,
-                                        mock_rename, mock_open,
-                                        mock_get_device):
+    def test_insert_image_no_local_file(self, mock_tempfile,
+                                        mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {}
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
 
         local_file = self.test_driver.insert_image(
             self.UUID, 'Cd', 'http://fish.it/red.iso', inserted=True,
             write_protected=False)
 
         self.assertEqual('/alphabet/soup/red.iso', local_file)
-        mock_requests.get.assert_called_once_with(
-            'http://fish.it/red.iso', stream=True, verify=False, auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/red.iso')
+        self.mock_http.get.assert_called_once_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/red.iso', 'wb')
 
         self.assertEqual('red.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -196,23 +313,18 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_full_url_v6(self, mock_requests, mock_tempfile,
-                                      mock_rename, mock_open,
-                                      mock_get_device):
+    def test_insert_image_full_url_v6(self, mock_tempfile,
+                                      mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {}
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
 
         full_url = 'http://[::2]:80/redfish/boot-abc?filename=tmp.iso'
         local_file = self.test_driver.insert_image(
@@ -220,11 +332,11 @@ class StaticDriverTestCase(base.BaseTestCase):
             inserted=True, write_protected=False)
 
         self.assertEqual('/alphabet/soup/boot-abc', local_file)
-        mock_requests.get.assert_called_once_with(full_url, stream=True,
-                                                  verify=False, auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/boot-abc')
+        self.mock_http.get.assert_called_once_with(full_url, stream=True,
+                                                   verify=False, auth=None,
+                                                   headers=self.HEADERS,
+                                                   timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/boot-abc', 'wb')
 
         self.assertEqual('boot-abc', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -232,25 +344,20 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_verify_ssl(self, mock_requests, mock_tempfile,
-                                     mock_rename, mock_open,
-                                     mock_get_device):
+    def test_insert_image_verify_ssl(self, mock_tempfile,
+                                     mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
 
         ssl_conf_key = 'SUSHY_EMULATOR_VMEDIA_VERIFY_SSL'
         default_ssl_verify = self.test_driver._config.get(ssl_conf_key)
@@ -263,11 +370,10 @@ class StaticDriverTestCase(base.BaseTestCase):
             self.test_driver._config[ssl_conf_key] = default_ssl_verify
 
         self.assertEqual('/alphabet/soup/fish.iso', local_file)
-        mock_requests.get.assert_called_once_with(
-            'https://fish.it/red.iso', stream=True, verify=True, auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/fish.iso')
+        self.mock_http.get.assert_called_once_with(
+            'https://fish.it/red.iso', stream=True, verify=True, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/fish.iso', 'wb')
 
         self.assertEqual('fish.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -276,37 +382,30 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_verify_ssl_changed(self, mock_requests,
-                                             mock_tempfile,
-                                             mock_rename, mock_open,
+    def test_insert_image_verify_ssl_changed(self, mock_tempfile, mock_open,
                                              mock_get_device):
         device_info = {'Verify': True}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
 
         local_file = self.test_driver.insert_image(
             self.UUID, 'Cd', 'https://fish.it/red.iso', inserted=True,
             write_protected=False)
 
         self.assertEqual('/alphabet/soup/fish.iso', local_file)
-        mock_requests.get.assert_called_once_with(
-            'https://fish.it/red.iso', stream=True, verify=True, auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/fish.iso')
+        self.mock_http.get.assert_called_once_with(
+            'https://fish.it/red.iso', stream=True, verify=True, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/fish.iso', 'wb')
 
         self.assertEqual('fish.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -315,12 +414,8 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_verify_ssl_custom(self, mock_requests,
-                                            mock_tempfile,
-                                            mock_rename, mock_open,
+    def test_insert_image_verify_ssl_custom(self, mock_tempfile, mock_open,
                                             mock_get_device):
         device_info = {'Verify': True,
                        'Certificate': {'String': 'abcd'}}
@@ -328,27 +423,31 @@ class StaticDriverTestCase(base.BaseTestCase):
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
+
+        mock_ntf = mock_tempfile.NamedTemporaryFile
+        mock_cert_file = mock_ntf.return_value.__enter__.return_value
 
         local_file = self.test_driver.insert_image(
             self.UUID, 'Cd', 'https://fish.it/red.iso', inserted=True,
             write_protected=False)
 
         self.assertEqual('/alphabet/soup/fish.iso', local_file)
-        mock_requests.get.assert_called_once_with(
+        mock_ntf.assert_called_once_with(mode='wt')
+        mock_cert_file.write.assert_called_once_with('abcd')
+        mock_ntf.return_value.__exit__.assert_called_once()
+        self.mock_http.get.assert_called_once_with(
             'https://fish.it/red.iso', stream=True,
-            verify=mock_tempfile.NamedTemporaryFile.return_value.name,
-            auth=None)
-        mock_open.assert_called_once_with(mock.ANY, 'wb')
-        mock_rename.assert_called_once_with(
-            'alphabet.soup', '/alphabet/soup/fish.iso')
+            verify=mock_cert_file.name, auth=None, headers=self.HEADERS,
+            timeout=self.TIMEOUT)
+        mock_open.assert_called_once_with('/alphabet/soup/fish.iso', 'wb')
+        self.mock_http.close.assert_called_once_with()
+        self.assertEqual({}, self.test_driver._http)
 
         self.assertEqual('fish.iso', device_info['Image'])
         self.assertTrue(device_info['Inserted'])
@@ -357,39 +456,726 @@ class StaticDriverTestCase(base.BaseTestCase):
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     @mock.patch.object(builtins, 'open', autospec=True)
-    @mock.patch.object(vmedia.os, 'rename', autospec=True)
     @mock.patch.object(vmedia, 'tempfile', autospec=True)
-    @mock.patch.object(vmedia, 'requests', autospec=True)
-    def test_insert_image_fail(self, mock_requests, mock_tempfile, mock_rename,
+    def test_insert_image_verify_separate_sessions(self, mock_tempfile,
+                                                   mock_open,
+                                                   mock_get_device):
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        sessions = []
+        for _ in range(2):
+            mock_http = mock.MagicMock()
+            mock_rsp = mock_http.get.return_value.__enter__.return_value
+            mock_rsp.headers = {}
+            mock_rsp.status_code = 200
+            mock_rsp.raw.read.return_value = b''
+            sessions.append(mock_http)
+        self.mock_session.side_effect = sessions
+
+        for verify in (False, True, False):
+            mock_get_device.return_value = {'Verify': verify}
+            self.test_driver.insert_image(
+                self.UUID, 'Cd', 'https://fish.it/red.iso',
+                write_protected=False)
+
+        self.assertEqual(2, self.mock_session.call_count)
+        unverified, verified = sessions
+        self.assertEqual(
+            [mock.call('https://fish.it/red.iso', stream=True, verify=False,
+                       auth=None, headers=self.HEADERS,
+                       timeout=self.TIMEOUT)] * 2,
+            unverified.get.call_args_list)
+        verified.get.assert_called_once_with(
+            'https://fish.it/red.iso', stream=True, verify=True, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+
+    def test__get_http_adapters(self):
+        self.test_driver._get_http(False)
+        self.test_driver._get_http(True)
+
+        adapters = [c[0][1] for c in self.mock_http.mount.call_args_list]
+        self.assertEqual(4, len(adapters))
+        for adapter in adapters[:2]:
+            self.assertIsInstance(adapter, vmedia._UnverifiedHTTPAdapter)
+        for adapter in adapters[2:]:
+            self.assertNotIsInstance(adapter, vmedia._UnverifiedHTTPAdapter)
+
+    def test__unverified_http_adapter(self):
+        adapter = vmedia._UnverifiedHTTPAdapter()
+
+        pool = adapter.poolmanager.connection_from_url('https://fish.it')
+        self.assertIsInstance(pool, vmedia._UnverifiedHTTPSConnectionPool)
+        pool = adapter.poolmanager.connection_from_url('http://fish.it')
+        self.assertNotIsInstance(pool, vmedia.urllib3_pool.HTTPSConnectionPool)
+
+        pool = requests_adapters.HTTPAdapter().poolmanager.connection_from_url(
+            'https://fish.it')
+        self.assertNotIsInstance(pool, vmedia._UnverifiedHTTPSConnectionPool)
+
+    def _mock_conn(self, on_connect=None):
+        conn = mock.Mock(sock=None, is_verified=False,
+                         proxy_is_verified=None, host='fish.it')
+        conn.connect.side_effect = on_connect
+        return conn
+
+    def test__unverified_https_connection_pool(self):
+        quiet = vmedia._UnverifiedHTTPSConnectionPool('fish.it')
+        other_quiet = vmedia._UnverifiedHTTPSConnectionPool('fish.it')
+        loud = vmedia.urllib3_pool.HTTPSConnectionPool('fish.it')
+        filters = list(warnings.filters)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            # NOTE: validate connections of both pools at the same time,
+            # like concurrent insertions do
+            conn = self._mock_conn(
+                lambda: other_quiet._validate_conn(self._mock_conn()))
+            quiet._validate_conn(conn)
+
+            conn.connect.assert_called_once_with()
+            self.assertEqual([], caught)
+
+            loud._validate_conn(self._mock_conn())
+
+            self.assertEqual([vmedia.urllib3_exc.InsecureRequestWarning],
+                             [w.category for w in caught])
+
+        self.assertEqual(filters, warnings.filters)
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_fail(self, mock_tempfile,
                                mock_open, mock_get_device):
         device_info = {}
         mock_get_device.return_value = device_info
 
         mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
         mock_tempfile.gettempdir.return_value = '/tmp'
-        mock_tmp_file = (mock_tempfile.NamedTemporaryFile
-                         .return_value.__enter__.return_value)
-        mock_tmp_file.name = 'alphabet.soup'
-        mock_rsp = mock_requests.get.return_value.__enter__.return_value
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
         mock_rsp.headers = {
             'content-disposition': 'attachment; filename="fish.iso"'
         }
         mock_rsp.status_code = 401
 
+        exc = self.assertRaises(error.FishyError,
+                                self.test_driver.insert_image,
+                                self.UUID, 'Cd', 'http://fish.it/red.iso',
+                                inserted=True, write_protected=False)
+        self.assertNotIsInstance(exc, error.TransientFishyError)
+        self.assertEqual(400, exc.code)
+        self.mock_http.get.assert_called_once_with(
+            'http://fish.it/red.iso', stream=True, auth=None, verify=False,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_open.assert_not_called()
+        self.assertEqual({}, device_info)
+
+    @mock.patch.object(vmedia.shutil, 'rmtree', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_write_fail(self, mock_tempfile, mock_open,
+                                     mock_get_device, mock_rmtree):
+        device_info = {}
+        mock_get_device.return_value = device_info
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_rsp = self.mock_http.get.return_value.__enter__.return_value
+        mock_rsp.headers = {}
+        mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b'fish'
+        mock_fl = mock_open.return_value.__enter__.return_value
+        mock_fl.write.side_effect = OSError(errno.ENOSPC, 'No space')
+
         self.assertRaises(error.FishyError,
                           self.test_driver.insert_image,
-                          self.UUID, 'Cd', 'http://fish.it/red.iso',
-                          inserted=True, write_protected=False)
-        mock_requests.get.assert_called_once_with(
-            'http://fish.it/red.iso', stream=True, auth=None, verify=False)
+                          self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.mock_http.get.assert_called_once_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_rmtree.assert_called_once_with('/alphabet/soup',
+                                            ignore_errors=True)
+        self.assertEqual({}, device_info)
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_retry(self, mock_tempfile,
+                                mock_open, mock_get_device, mock_sleep):
+        device_info = {}
+        mock_get_device.return_value = device_info
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_get = self.mock_http.get
+        mock_rsp = mock_get.return_value.__enter__.return_value
+        mock_rsp.headers = {
+            'content-disposition': 'attachment; filename="fish.iso"'
+        }
+        mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
+        mock_get.side_effect = [vmedia.requests_exc.ConnectionError(),
+                                vmedia.requests_exc.Timeout(),
+                                mock_get.return_value]
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.assertEqual(3, mock_get.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertEqual('fish.iso', device_info['Image'])
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_retry_server_error(self, mock_tempfile, mock_open,
+                                             mock_get_device, mock_sleep):
+        device_info = {}
+        mock_get_device.return_value = device_info
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_get = self.mock_http.get
+        mock_failed = mock.MagicMock()
+        mock_failed.__enter__.return_value.status_code = 503
+        mock_rsp = mock_get.return_value.__enter__.return_value
+        mock_rsp.headers = {
+            'content-disposition': 'attachment; filename="fish.iso"'
+        }
+        mock_rsp.status_code = 200
+        mock_rsp.raw.read.return_value = b''
+        mock_get.side_effect = [mock_failed, mock_get.return_value]
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.assertEqual(2, mock_get.call_count)
+        mock_sleep.assert_called_once_with(mock.ANY)
+
+    def _mock_response(self, status_code=200, headers=None, chunks=()):
+        mock_cm = mock.MagicMock()
+        mock_rsp = mock_cm.__enter__.return_value
+        mock_rsp.status_code = status_code
+        mock_rsp.headers = headers or {}
+        mock_rsp.raw.read.side_effect = list(chunks) + [b'']
+        return mock_cm
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_resume(self, mock_tempfile, mock_open,
+                                 mock_get_device, mock_sleep):
+        device_info = {}
+        mock_get_device.return_value = device_info
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_fl = mock_open.return_value.__enter__.return_value
+        mock_fl.tell.return_value = 4
+        self.mock_http.get.side_effect = [
+            self._mock_response(
+                headers={'content-disposition': 'filename="fish.iso"',
+                         'accept-ranges': 'bytes',
+                         'etag': '"v1"'},
+                chunks=[b'fish', vmedia.urllib3_exc.ProtocolError()]),
+            self._mock_response(
+                status_code=206,
+                headers={'content-range': 'bytes 4-7/8'},
+                chunks=[b'soup']),
+        ]
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.mock_http.get.assert_called_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers={'Accept-Encoding': 'identity',
+                     'Range': 'bytes=4-',
+                     'If-Range': '"v1"'},
+            timeout=self.TIMEOUT)
+        mock_tempfile.mkdtemp.assert_called_once_with()
+        self.assertEqual([mock.call('/alphabet/soup/fish.iso', 'wb'),
+                          mock.call('/alphabet/soup/fish.iso', 'r+b')],
+                         mock_open.call_args_list)
+        mock_fl.seek.assert_called_once_with(4)
+        self.assertEqual([mock.call(b'fish'), mock.call(b'soup')],
+                         mock_fl.write.call_args_list)
+        self.assertEqual(local_file, device_info['_local_file'])
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_resume_read_timeout(self, mock_tempfile, mock_open,
+                                              mock_get_device, mock_sleep):
+        mock_get_device.return_value = {}
+
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_fl = mock_open.return_value.__enter__.return_value
+        mock_fl.tell.return_value = 4
+        self.mock_http.get.side_effect = [
+            self._mock_response(
+                headers={'content-disposition': 'filename="fish.iso"',
+                         'accept-ranges': 'bytes',
+                         'etag': '"v1"'},
+                chunks=[b'fish', vmedia.urllib3_exc.ReadTimeoutError(
+                    None, 'http://fish.it/red.iso', 'Read timed out.')]),
+            self._mock_response(
+                status_code=206,
+                headers={'content-range': 'bytes 4-7/8'},
+                chunks=[b'soup']),
+        ]
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.mock_http.get.assert_called_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers={'Accept-Encoding': 'identity',
+                     'Range': 'bytes=4-',
+                     'If-Range': '"v1"'},
+            timeout=self.TIMEOUT)
+        mock_fl.seek.assert_called_once_with(4)
+        self.assertEqual([mock.call(b'fish'), mock.call(b'soup')],
+                         mock_fl.write.call_args_list)
+
+    def test__get_timeout(self):
+        self.assertEqual((10, 60), self.test_driver._get_timeout())
+
+        self.test_driver._config = dict(
+            self.CONFIG, SUSHY_EMULATOR_VMEDIA_TIMEOUT=[5, 30])
+        self.assertEqual((5, 30), self.test_driver._get_timeout())
+
+        self.test_driver._config = dict(
+            self.CONFIG, SUSHY_EMULATOR_VMEDIA_TIMEOUT=5)
+        self.assertEqual((5, 5), self.test_driver._get_timeout())
+
+        self.test_driver._config = dict(
+            self.CONFIG, SUSHY_EMULATOR_VMEDIA_TIMEOUT=None)
+        self.assertIsNone(self.test_driver._get_timeout())
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.shutil, 'rmtree', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_resume_unsupported(self, mock_tempfile, mock_open,
+                                             mock_get_device, mock_rmtree,
+                                             mock_sleep):
+        mock_get_device.return_value = {}
+
+        mock_tempfile.mkdtemp.side_effect = ['/alphabet/soup',
+                                             '/alphabet/pasta']
+        self.mock_http.get.side_effect = [
+            self._mock_response(
+                headers={'etag': '"v1"'},
+                chunks=[vmedia.urllib3_exc.ProtocolError()]),
+            self._mock_response(headers={'etag': '"v1"'}),
+        ]
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/pasta/red.iso', local_file)
+        self.mock_http.get.assert_called_with(
+            'http://fish.it/red.iso', stream=True, verify=False, auth=None,
+            headers=self.HEADERS, timeout=self.TIMEOUT)
+        mock_rmtree.assert_called_once_with('/alphabet/soup',
+                                            ignore_errors=True)
+
+    @mock.patch('time.sleep', autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test_insert_image_retry_exhausted(self, mock_tempfile, mock_open,
+                                          mock_get_device, mock_sleep):
+        device_info = {}
+        mock_get_device.return_value = device_info
+
+        self.mock_http.get.side_effect = vmedia.requests_exc.ConnectionError()
+
+        exc = self.assertRaises(error.TransientFishyError,
+                                self.test_driver.insert_image,
+                                self.UUID, 'Cd', 'http://fish.it/red.iso')
+        self.assertEqual(502, exc.code)
+        self.assertEqual(5, self.mock_http.get.call_count)
+        for call in mock_sleep.call_args_list:
+            self.assertLessEqual(call[0][0], 16)
         mock_open.assert_not_called()
         self.assertEqual({}, device_info)
 
+    def _make_image(self, name='fish.iso', content=b'fish'):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        path = os.path.join(temp_dir, name)
+        with open(path, 'wb') as fl:
+            fl.write(content)
+        return path
+
+    def _enable_image_cache(self, size=1024):
+        self.test_driver._config = dict(
+            self.CONFIG, SUSHY_EMULATOR_VMEDIA_CACHE_SIZE=size)
+
+    def test__cache_image_disabled(self):
+        self.test_driver._cache_image('http://fish.it/red.iso', '"v1"',
+                                      self._make_image())
+        self.assertEqual({}, self.test_driver._image_cache)
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_cached(self, mock_get_device):
+        self._enable_image_cache()
+        device_info = {}
+        mock_get_device.return_value = device_info
+        source = self._make_image()
+        self.test_driver._cache_image('http://fish.it/red.iso', '"v1"',
+                                      source)
+        cached_path = self.test_driver._image_cache[
+            'http://fish.it/red.iso'][0]
+        self.addCleanup(shutil.rmtree, os.path.dirname(cached_path),
+                        ignore_errors=True)
+        mock_rsp = self.mock_http.head.return_value.__enter__.return_value
+        mock_rsp.status_code = 200
+        mock_rsp.headers = {'etag': '"v1"'}
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+        self.addCleanup(shutil.rmtree, os.path.dirname(local_file),
+                        ignore_errors=True)
+
+        self.assertNotEqual(cached_path, local_file)
+        self.assertEqual('fish.iso', os.path.basename(local_file))
+        self.assertTrue(os.path.samefile(source, local_file))
+        self.mock_http.head.assert_called_once_with(
+            'http://fish.it/red.iso', auth=None, verify=False,
+            headers=self.HEADERS, timeout=self.TIMEOUT,
+            allow_redirects=True)
+        self.mock_http.get.assert_not_called()
+        self.assertEqual(local_file, device_info['_local_file'])
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_cache_stale(self, mock_get_device, mock_fetch):
+        self._enable_image_cache()
+        mock_get_device.return_value = {}
+        self.test_driver._image_cache['http://fish.it/red.iso'] = (
+            '/alphabet/soup/fish.iso', '"v1"', 4)
+        mock_rsp = self.mock_http.head.return_value.__enter__.return_value
+        mock_rsp.status_code = 200
+        mock_rsp.headers = {'etag': '"v2"'}
+        mock_fetch.return_value = '/alphabet/pasta/fish.iso', '"v2"'
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/pasta/fish.iso', local_file)
+        mock_fetch.assert_called_once_with(
+            self.test_driver, 'http://fish.it/red.iso', None, False, {},
+            on_write=mock.ANY)
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_cache_writable(self, mock_get_device, mock_fetch):
+        self._enable_image_cache()
+        mock_get_device.return_value = {}
+        source = self._make_image()
+        mock_fetch.return_value = source, '"v1"'
+
+        self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso', write_protected=False)
+
+        self.mock_http.head.assert_not_called()
+        self.assertEqual({}, self.test_driver._image_cache)
+
+    def _inserted_device_info(self):
+        return {
+            '_local_file': self._make_image(),
+            '_image_url': 'http://fish.it/red.iso',
+            '_image_version': '"v1"',
+            'Image': 'fish.iso',
+            'Inserted': True,
+            'WriteProtected': True,
+            'UserName': '',
+            'Password': '',
+        }
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_already_inserted(self, mock_get_device,
+                                           mock_fetch):
+        device_info = self._inserted_device_info()
+        expected = dict(device_info)
+        mock_get_device.return_value = device_info
+        mock_rsp = self.mock_http.head.return_value.__enter__.return_value
+        mock_rsp.status_code = 200
+        mock_rsp.headers = {'etag': '"v1"'}
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual(expected['_local_file'], local_file)
+        self.assertEqual(expected, device_info)
+        mock_fetch.assert_not_called()
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_already_inserted_changed(self, mock_get_device,
+                                                   mock_fetch):
+        device_info = self._inserted_device_info()
+        previous_file = device_info['_local_file']
+        mock_get_device.return_value = device_info
+        mock_rsp = self.mock_http.head.return_value.__enter__.return_value
+        mock_rsp.status_code = 200
+        mock_rsp.headers = {'etag': '"v2"'}
+        mock_fetch.return_value = '/alphabet/soup/fish.iso', '"v2"'
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.assertEqual('"v2"', device_info['_image_version'])
+        self.assertFalse(os.path.exists(previous_file))
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_already_inserted_flags_changed(self,
+                                                         mock_get_device,
+                                                         mock_fetch):
+        device_info = self._inserted_device_info()
+        mock_get_device.return_value = device_info
+        mock_fetch.return_value = '/alphabet/soup/fish.iso', '"v1"'
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso', write_protected=False)
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        self.mock_http.head.assert_not_called()
+        self.assertFalse(device_info['WriteProtected'])
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared(self, mock_get_device):
+        device_info = {}
+        mock_get_device.return_value = device_info
+        source = self._make_image()
+        shared = vmedia._SharedDownload()
+        shared.future.set_result((source, '"v1"'))
+        self.test_driver._inflight[
+            ('http://fish.it/red.iso', None, None, False)] = shared
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+        self.addCleanup(shutil.rmtree, os.path.dirname(local_file),
+                        ignore_errors=True)
+
+        self.assertNotEqual(source, local_file)
+        self.assertTrue(os.path.samefile(source, local_file))
+        self.mock_http.get.assert_not_called()
+        self.assertEqual(local_file, device_info['_local_file'])
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared_failed(self, mock_get_device):
+        device_info = {}
+        mock_get_device.return_value = device_info
+        shared = vmedia._SharedDownload()
+        shared.future.set_exception(error.FishyError('boom', code=400))
+        self.test_driver._inflight[
+            ('http://fish.it/red.iso', None, None, False)] = shared
+
+        exc = self.assertRaises(error.FishyError,
+                                self.test_driver.insert_image,
+                                self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual(400, exc.code)
+        self.mock_http.get.assert_not_called()
+        self.assertEqual({}, device_info)
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared_progressing(self, mock_get_device,
+                                             mock_fetch):
+        device_info = {}
+        mock_get_device.return_value = device_info
+        source = self._make_image()
+        shared = vmedia._SharedDownload()
+        self.test_driver._inflight[
+            ('http://fish.it/red.iso', None, None, False)] = shared
+        results = [futures.TimeoutError, futures.TimeoutError,
+                   (source, '"v1"')]
+
+        def result(timeout):
+            self.assertLessEqual(timeout, 5 * (10 + 60 + 16))
+            # NOTE: the leader writes more of the image in the meantime
+            shared.touch()
+            outcome = results.pop(0)
+            if outcome is futures.TimeoutError:
+                raise outcome
+            return outcome
+
+        with mock.patch.object(shared.future, 'result', autospec=True,
+                               side_effect=result):
+            local_file = self.test_driver.insert_image(
+                self.UUID, 'Cd', 'http://fish.it/red.iso')
+        self.addCleanup(shutil.rmtree, os.path.dirname(local_file),
+                        ignore_errors=True)
+
+        self.assertEqual([], results)
+        self.assertTrue(os.path.samefile(source, local_file))
+        mock_fetch.assert_not_called()
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared_stalled(self, mock_get_device, mock_fetch):
+        device_info = {}
+        mock_get_device.return_value = device_info
+        fetch_key = ('http://fish.it/red.iso', None, None, False)
+        stalled = self.test_driver._inflight[fetch_key] = (
+            vmedia._SharedDownload())
+        stalled.touched -= 5 * (10 + 60 + 16)
+
+        def fetch(*args, **kwargs):
+            # NOTE: the insertion takes the download over, so that others
+            # wait for it instead of the stalled one
+            shared = self.test_driver._inflight[fetch_key]
+            self.assertIsNot(stalled, shared)
+            self.assertEqual(shared.touch, kwargs['on_write'])
+            return '/alphabet/soup/fish.iso', '"v1"'
+
+        mock_fetch.side_effect = fetch
+
+        local_file = self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual('/alphabet/soup/fish.iso', local_file)
+        mock_fetch.assert_called_once_with(
+            self.test_driver, 'http://fish.it/red.iso', None, False, {},
+            on_write=mock.ANY)
+        self.assertFalse(stalled.future.done())
+        self.assertEqual({}, self.test_driver._inflight)
+        self.assertEqual(local_file, device_info['_local_file'])
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared_leader(self, mock_get_device, mock_fetch):
+        mock_get_device.return_value = {}
+        fetch_key = ('http://fish.it/red.iso', ('Admin', 'Secret'), None,
+                     False)
+
+        def fetch(*args, **kwargs):
+            shared = self.test_driver._inflight[fetch_key]
+            self.assertFalse(shared.future.done())
+            self.assertEqual(shared.touch, kwargs['on_write'])
+            return '/alphabet/soup/fish.iso', None
+
+        mock_fetch.side_effect = fetch
+
+        self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso',
+            username='Admin', password='Secret')
+
+        mock_fetch.assert_called_once_with(
+            self.test_driver, 'http://fish.it/red.iso', ('Admin', 'Secret'),
+            False, {}, on_write=mock.ANY)
+        self.assertEqual({}, self.test_driver._inflight)
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_shared_leader_taken_over(self, mock_get_device,
+                                                   mock_fetch):
+        mock_get_device.return_value = {}
+        fetch_key = ('http://fish.it/red.iso', None, None, False)
+        successor = vmedia._SharedDownload()
+
+        def fetch(*args, **kwargs):
+            self.test_driver._inflight[fetch_key] = successor
+            return '/alphabet/soup/fish.iso', None
+
+        mock_fetch.side_effect = fetch
+
+        self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
+
+        self.assertEqual({fetch_key: successor}, self.test_driver._inflight)
+
+    @mock.patch.object(builtins, 'open', autospec=True)
+    @mock.patch.object(vmedia, 'tempfile', autospec=True)
+    def test__fetch_and_create_local_image_on_write(self, mock_tempfile,
+                                                    mock_open):
+        mock_tempfile.mkdtemp.return_value = '/alphabet/soup'
+        mock_fl = mock_open.return_value.__enter__.return_value
+        self.mock_http.get.return_value = self._mock_response(
+            chunks=[b'fish', b'soup'])
+        on_write = mock.Mock()
+
+        self.test_driver._fetch_and_create_local_image(
+            'http://fish.it/red.iso', None, False, {}, on_write=on_write)
+
+        self.assertEqual([mock.call(b'fish'), mock.call(b'soup')],
+                         mock_fl.write.call_args_list)
+        self.assertEqual(2, on_write.call_count)
+
+    def test__cache_image_evict(self):
+        self._enable_image_cache(size=10)
+
+        self.test_driver._cache_image('http://fish.it/red.iso', '"v1"',
+                                      self._make_image(content=b'redfish'))
+        red_path = self.test_driver._image_cache[
+            'http://fish.it/red.iso'][0]
+        self.test_driver._cache_image('http://fish.it/blue.iso', '"v1"',
+                                      self._make_image(content=b'bluefish'))
+        blue_path = self.test_driver._image_cache[
+            'http://fish.it/blue.iso'][0]
+        self.addCleanup(shutil.rmtree, os.path.dirname(blue_path),
+                        ignore_errors=True)
+
+        self.assertEqual(['http://fish.it/blue.iso'],
+                         list(self.test_driver._image_cache))
+        self.assertFalse(os.path.exists(os.path.dirname(red_path)))
+        self.assertTrue(os.path.exists(blue_path))
+
+    def test__cache_image_dir(self):
+        self._enable_image_cache()
+
+        self.test_driver._cache_image('http://fish.it/red.iso', '"v1"',
+                                      self._make_image())
+
+        cached_path = self.test_driver._image_cache[
+            'http://fish.it/red.iso'][0]
+        self.assertEqual(
+            os.path.join(self.temp_dir, 'sushy-emulator-vmedia-cache',
+                         str(os.getpid())),
+            os.path.dirname(os.path.dirname(cached_path)))
+
+    @mock.patch.object(vmedia, '_is_running', autospec=True)
+    def test__clear_image_cache_dir(self, mock_is_running):
+        cache_root = os.path.dirname(self.test_driver._image_cache_dir)
+        for entry in (str(os.getpid()), '100001', '100002', 'other'):
+            os.makedirs(os.path.join(cache_root, entry, 'soup'))
+        mock_is_running.side_effect = lambda pid: pid == 100001
+
+        self.test_driver._clear_image_cache_dir()
+
+        self.assertEqual(['100001', 'other'], sorted(os.listdir(cache_root)))
+        self.assertEqual(2, mock_is_running.call_count)
+
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    @mock.patch.object(vmedia.os, 'rmdir', autospec=True)
     @mock.patch.object(vmedia.os, 'unlink', autospec=True)
-    def test_eject_image(self, mock_unlink, mock_get_device):
+    def test_eject_image(self, mock_unlink, mock_rmdir, mock_get_device):
         device_info = {
-            '_local_file': '/tmp/fish.iso'
+            '_local_file': '/tmp/soup/fish.iso',
+            '_image_url': 'http://fish.it/red.iso',
         }
         mock_get_device.return_value = device_info
 
@@ -399,8 +1185,41 @@ class StaticDriverTestCase(base.BaseTestCase):
         self.assertEqual('', device_info['ImageName'])
         self.assertFalse(device_info['Inserted'])
         self.assertFalse(device_info['WriteProtected'])
+        self.assertNotIn('_local_file', device_info)
+        self.assertNotIn('_image_url', device_info)
+
+        mock_unlink.assert_called_once_with('/tmp/soup/fish.iso')
+        mock_rmdir.assert_called_once_with('/tmp/soup')
+
+    def test_eject_image_twice(self):
+        local_file = self._make_image()
+        device_info = self.test_driver._get_device(self.UUID, 'Cd')
+        device_info['_local_file'] = local_file
+        self.test_driver._devices[(self.UUID, 'Cd')] = device_info
+
+        self.test_driver.eject_image(self.UUID, 'Cd')
+
+        self.assertFalse(os.path.exists(os.path.dirname(local_file)))
+        self.assertNotIn('_local_file',
+                         self.test_driver._devices[(self.UUID, 'Cd')])
+
+        self.test_driver.eject_image(self.UUID, 'Cd')
+
+    @mock.patch.object(vmedia.StaticDriver, '_fetch_and_create_local_image',
+                       autospec=True)
+    @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
+    def test_insert_image_replaces_previous(self, mock_get_device,
+                                            mock_fetch):
+        previous_file = self._make_image()
+        device_info = {'_local_file': previous_file}
+        mock_get_device.return_value = device_info
+        mock_fetch.return_value = '/alphabet/soup/fish.iso', None
+
+        self.test_driver.insert_image(
+            self.UUID, 'Cd', 'http://fish.it/red.iso')
 
-        mock_unlink.assert_called_once_with('/tmp/fish.iso')
+        self.assertEqual('/alphabet/soup/fish.iso', device_info['_local_file'])
+        self.assertFalse(os.path.exists(os.path.dirname(previous_file)))
 
     @mock.patch.object(vmedia.StaticDriver, '_get_device', autospec=True)
     def test_list_certificates(self, mock_get_device):
@@ -171,6 +171,39 @@ class PersistentDictTestCase(base.BaseTestCase):
             (pickle.dumps(1), pickle.dumps(2)))
         self.assertEqual(2, mock_cursor.execute.call_count)
 
+    def test_update(self, mock_sqlite3):
+        pd = memoize.PersistentDict()
+        pd.make_permanent('/', 'file')
+
+        mock_conn = mock_sqlite3.return_value.__enter__.return_value
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.execute.reset_mock()
+
+        pd.update({1: 2}, x=3)
+
+        mock_sqlite3.assert_called_with('/file.sqlite')
+        self.assertEqual(2, mock_sqlite3.call_count)
+        mock_cursor.executemany.assert_called_once_with(
+            'insert or replace into cache values (?, ?)',
+            [(pickle.dumps(1), pickle.dumps(2)),
+             (pickle.dumps('x'), pickle.dumps(3))])
+        mock_cursor.execute.assert_not_called()
+
+    def test_update_retries(self, mock_sqlite3):
+        pd = memoize.PersistentDict()
+        pd.make_permanent('/', 'file')
+
+        mock_conn = mock_sqlite3.return_value.__enter__.return_value
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.executemany.side_effect = [
+            sqlite3.OperationalError,
+            None
+        ]
+
+        pd.update({1: 2})
+
+        self.assertEqual(2, mock_cursor.executemany.call_count)
+
     def test___delitem__(self, mock_sqlite3):
         pd = memoize.PersistentDict()
         pd.make_permanent('/', 'file')